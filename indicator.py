@@ -1,27 +1,41 @@
-import re
 from typing import Tuple, List
 import ast
 from datetime import datetime
-import csv
-import shutil
+from functools import lru_cache
 from tqdm import tqdm
-import os
-import spacy
-nlp = spacy.load("en_core_web_sm", disable=["ner", "parser"])
-
-def _normalize(text: str) -> list[str]:
-    doc = nlp(text.lower())
-    return [token.lemma_ for token in doc if not token.is_stop and token.is_alpha]
+import ahocorasick
+import pandas as pd
 
 def parse_drug_terms(drug_entry: str) -> List[str]:
     """Return all names from a ``(brand, generic)`` tuple string."""
+    return list(_parse_drug_terms(drug_entry))
+
+
+def _is_simple_quoted(part: str) -> bool:
+    return len(part) >= 2 and part[0] == part[-1] and part[0] in "'\"" and part[0] not in part[1:-1] and "\\" not in part
+
+
+@lru_cache(maxsize=4096)
+def _parse_drug_terms(drug_entry: str) -> Tuple[str, ...]:
+    # Without a bracket or comma nothing can evaluate to a list/tuple; plain names are the common case
+    if not any(char in drug_entry for char in "([,"):
+        return (drug_entry,)
+
+    stripped = drug_entry.strip()
+    bracketed = (stripped.startswith("(") and stripped.endswith(")")) or (stripped.startswith("[") and stripped.endswith("]"))
+
+    # Fast path for ('brand', 'generic'): every comma-separated part is a plain quoted string
+    parts = [part.strip() for part in stripped[1:-1].split(",")] if bracketed else []
+    if len(parts) > 1 and all(_is_simple_quoted(part) for part in parts):
+        return tuple(part[1:-1] for part in parts)
+
     try:
         value = ast.literal_eval(drug_entry)
         if isinstance(value, (list, tuple)):
-            return [str(v) for v in value if isinstance(v, str)]
+            return tuple(str(v) for v in value if isinstance(v, str))
     except Exception:
         pass
-    return [drug_entry]
+    return (drug_entry,)
 
 
 # Words Sets & Intended Weights TODO: Lemma-tize
@@ -54,6 +68,51 @@ CHEMOTHERAPY_AGENTS = {
     "Etoposide", "Topotecan", "Irinotecan",
 } # Weight = 0, Should be hidable 
 
+CLINICAL_INDICATORS = {
+    'clinical_study': CLINICAL_STUDY,
+    'case_report': CASE_REPORT,
+    'animal_evidence': ANIMAL_EVIDENCE,
+    'cell_line': CELL_LINES,
+    'imaging_evidence': IMAGING_EVIDENCE,
+    'retrospective': RETROSPECTIVE_STUDY,
+}
+
+
+def _build_automaton(lexicons: dict, expand=None) -> ahocorasick.Automaton:
+    """Compile every lexicon term (or each of its ``expand``-ed surface forms) into one automaton.
+
+    Each pattern maps to ``(form, hits)`` where ``hits`` holds the ``(term, bucket)`` pairs it counts towards.
+    """
+    automaton = ahocorasick.Automaton()
+    for bucket, terms in lexicons.items():
+        for term in terms:
+            for form in (expand(term) if expand else (term,)):
+                _, hits = automaton.get(form, (form, ()))
+                automaton.add_word(form, (form, hits + ((term, bucket),)))
+    automaton.make_automaton()
+    return automaton
+
+
+def _count_indicators(automaton: ahocorasick.Automaton, lexicons: dict, text: str, whole_words: bool = False) -> dict:
+    """Count the distinct lexicon terms present in ``text`` per bucket, in a single pass.
+
+    With ``whole_words`` a match only counts when it is not flanked by letters, i.e. it is a full token.
+    """
+    matched = set()
+    for end, (form, hits) in automaton.iter(text):
+        if whole_words:
+            start = end - len(form) + 1
+            if (start > 0 and text[start - 1].isalpha()) or (end + 1 < len(text) and text[end + 1].isalpha()):
+                continue
+        matched.update(hits)
+    indicators = dict.fromkeys(lexicons, 0)
+    for _, bucket in matched:
+        indicators[bucket] += 1
+    return indicators
+
+
+CLINICAL_AUTOMATON = _build_automaton(CLINICAL_INDICATORS)
+
 
 # ---------- LEMMA-LEVEL LEXICONS (single-token lemmas) ----------
 DIRECT_INTERACTION = {
@@ -76,54 +135,121 @@ PHARMACOGENOMIC_SIGNALS = {
     "metabolize", "substrate", "induce", "inducer", "inhibit", "polymorphism", "variant", "mutation", "mutant", "allele", "genotype", "haplotype", "isoform", "splice", "wildtype", "germline", "somatic", "clearance", "exposure", "auc", "cmax", "tmax"
 }
 
+INTERACTION_INDICATORS = {
+    'direct_interaction': DIRECT_INTERACTION,
+    'binding_interaction': BINDING_INTERACTION,
+    'regulation_changes': REGULATION_CHANGES,
+    'sensitivity_resistance': SENSITIVITY_RESISTANCE,
+    'pharmacogenomic_signals': PHARMACOGENOMIC_SIGNALS,
+}
 
-def analyze_relation_interaction(gene: str, abstract: str) -> Tuple[str, float]:
-    """
-    """
-    text = abstract.lower()
-    lemmas = _normalize(text)
-    lemma_set = set(lemmas)
+# Inflections the regular suffix rules in _inflections cannot produce
+IRREGULAR_FORMS = {
+    "bind": {"bound"},
+}
 
-    indicators = {}
-    indicators['direct_interaction'] = sum(lemma in lemma_set for lemma in DIRECT_INTERACTION)
-    indicators['binding_interaction'] = sum(lemma in lemma_set for lemma in BINDING_INTERACTION)
-    indicators['regulation_changes'] = sum(lemma in lemma_set for lemma in REGULATION_CHANGES)
-    indicators['sensitivity_resistance'] = sum(lemma in lemma_set for lemma in SENSITIVITY_RESISTANCE)
-    indicators['pharmacogenomic_signals'] = sum(lemma in lemma_set for lemma in PHARMACOGENOMIC_SIGNALS)
 
-    indicators['unweighted_total'] = sum(indicators.values())
+def _inflections(lemma: str) -> set[str]:
+    """Surface forms of ``lemma``: itself, plural / 3rd person, past tense and gerund."""
+    forms = {lemma} | IRREGULAR_FORMS.get(lemma, set())
+    consonant_y = lemma.endswith("y") and lemma[-2:-1] not in "aeiou"
+    if lemma.endswith(("s", "x", "z", "ch", "sh")):
+        forms.add(lemma + "es")
+    elif consonant_y:
+        forms.add(lemma[:-1] + "ies")
+    else:
+        forms.add(lemma + "s")
+    if lemma.endswith("e"):
+        forms.add(lemma + "d")
+        forms.add(lemma + "ing" if lemma.endswith("ee") else lemma[:-1] + "ing")
+    elif consonant_y:
+        forms.add(lemma[:-1] + "ied")
+        forms.add(lemma + "ing")
+    else:
+        forms.add(lemma + "ed")
+        forms.add(lemma + "ing")
+    return forms
+
+
+INTERACTION_AUTOMATON = _build_automaton(INTERACTION_INDICATORS, expand=_inflections)
+
 
-    label = 'interaction_evidence' if indicators['unweighted_total'] > 0 else 'no_interaction_evidence'
-    
+def _mentions(text: str, drug: str, gene: str) -> bool:
+    """Literal check that both lowercased names occur in the lowercased ``text``."""
+    return drug in text and gene in text
+
+
+def _score_indicators(indicators: dict, evidence_label: str) -> Tuple[str, dict]:
+    """Total the bucket counts and label them ``evidence_label`` or ``no_<evidence_label>``."""
+    indicators['unweighted_total'] = sum(indicators.values())
+    label = evidence_label if indicators['unweighted_total'] > 0 else f'no_{evidence_label}'
     return label, indicators
 
+
+def _score_clinical(text: str) -> Tuple[str, dict]:
+    indicators = _count_indicators(CLINICAL_AUTOMATON, CLINICAL_INDICATORS, text)
+    return _score_indicators(indicators, 'indicator_evidence')
+
+
+def _score_interaction(text: str) -> Tuple[str, dict]:
+    indicators = _count_indicators(INTERACTION_AUTOMATON, INTERACTION_INDICATORS, text, whole_words=True)
+    return _score_indicators(indicators, 'interaction_evidence')
+
+
+def analyze_relation_interaction(gene: str, abstract: str, drug: str = None) -> Tuple[str, float]:
+    """
+    """
+    text = abstract.lower()
+    if drug is not None and not _mentions(text, drug.lower(), gene.lower()):
+        return ('not_evaluated', 0.0)
+
+    return _score_interaction(text)
+
 def analyze_relation(drug: str, gene: str, abstract: str) -> Tuple[str, float]:
     """
     """
 
     text = abstract.lower()
-    drug_present = re.search(re.escape(drug.lower()), text) is not None
-    gene_present = re.search(re.escape(gene.lower()), text) is not None
-
-    if not (drug_present and gene_present):
+    if not _mentions(text, drug.lower(), gene.lower()):
         return ('not_evaluated', 0.0)
 
-    indicators = {}
-    
-    indicators['clinical_study'] = sum(word in text for word in CLINICAL_STUDY)
-    indicators['case_report'] = sum(word in text for word in CASE_REPORT)
-    indicators['animal_evidence'] = sum(word in text for word in ANIMAL_EVIDENCE)
-    indicators['cell_line'] = sum(word in text for word in CELL_LINES)
-    indicators['imaging_evidence'] = sum(word in text for word in IMAGING_EVIDENCE)
-    indicators['retrospective'] = sum(word in text for word in RETROSPECTIVE_STUDY)
-    indicators['unweighted_total'] = sum(indicators.values())
+    return _score_clinical(text)
 
-    if indicators['unweighted_total'] > 0:
-        label = 'indicator_evidence'
-    else:
-        label = 'no_indicator_evidence'
 
-    return label, indicators
+def _abstract_records(abstracts, start=0, stop=-1) -> List[tuple]:
+    """``(pmid, abstract, tagged_drugs, concepts)`` tuples for ``abstracts.iloc[start:stop]``.
+
+    pmid/abstract fall back to the first two columns; the NLP drug columns are ``None`` when absent.
+    """
+    subset = abstracts.iloc[start:stop]
+    pmid_col = 'pmid' if 'pmid' in subset.columns else subset.columns[0]
+    abstract_col = 'abstract' if 'abstract' in subset.columns else subset.columns[1]
+    if 'DRUG_LABELS' in subset.columns and 'DRUG_IDS' in subset.columns:
+        return list(subset[[pmid_col, abstract_col, 'DRUG_LABELS', 'DRUG_IDS']].itertuples(index=False, name=None))
+    return [(pmid, abstract, None, None) for pmid, abstract in subset[[pmid_col, abstract_col]].itertuples(index=False, name=None)]
+
+
+def _score_columns(scores, lexicons: dict) -> dict:
+    """Flatten a scores dict (or the 0.0 of an unevaluated pair) into one count per indicator."""
+    keys = [*lexicons, 'unweighted_total']
+    if not isinstance(scores, dict):
+        return dict.fromkeys(keys, 0)
+    return {key: scores[key] for key in keys}
+
+
+def _results_frame(results: List[dict], columns: List[str], lexicons: dict) -> pd.DataFrame:
+    """Build a result DataFrame from row dicts, narrowing the indicator columns to int32."""
+    df = pd.DataFrame(results, columns=columns)
+    score_columns = [*lexicons, 'unweighted_total']
+    df[score_columns] = df[score_columns].astype('int32')
+    return df
+
+
+def _write_results(frames: List[pd.DataFrame], out_path: str):
+    """Concatenate result frames once and write them to a single zstd Parquet file."""
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df.to_parquet(out_path, compression='zstd', index=False)
+    print(f'Results saved to {out_path}!')
 
 
 def generate_interaction_evidence(abstracts, reference_df, start=0, stop=-1):
@@ -133,76 +259,56 @@ def generate_interaction_evidence(abstracts, reference_df, start=0, stop=-1):
     timestamp_folder = f'{timestamp}_{gene}'
 
     results = []
-    for _, row in tqdm(abstracts.iloc[start:stop].iterrows(), desc="Abstracts", leave=False):
-        pmid = row['pmid'] if 'pmid' in row else row.iloc[0]
-        abstract = row['abstract'] if 'abstract' in row else row.iloc[1]
-        tagged_drugs = row['DRUG_LABELS']
-        concept = row['DRUG_IDS']
-
+    for pmid, abstract, tagged_drugs, concept in tqdm(_abstract_records(abstracts, start, stop), desc="Abstracts", leave=False):
         label,scores = analyze_relation_interaction(gene, abstract)
 
-        results.append({"pmid": pmid, 'abstract': abstract, "label": label, "scores": scores, 'tagged_drugs': tagged_drugs, 'concepts': concept  })
+        results.append({"pmid": pmid, 'abstract': abstract, "label": label, **_score_columns(scores, INTERACTION_INDICATORS), 'tagged_drugs': tagged_drugs, 'concepts': concept, 'gene': gene})
 
-    os.makedirs(timestamp_folder, exist_ok=True)
-    out_filename = f'{gene}_interaction_search.csv'.replace("/", "-")
-    out_path = os.path.join(timestamp_folder, out_filename)
-    with open(out_path, "w", newline="") as fh:
-        writer = csv.DictWriter(fh, fieldnames=["pmid",'abstract', "label", "scores", 'tagged_drugs', 'concepts'])
-        writer.writeheader()
-        writer.writerows(results)
-                    
-    archive_path = shutil.make_archive(base_name=timestamp_folder, format="zip", base_dir=f'{timestamp}_{gene}')
-    shutil.rmtree(timestamp_folder)
-    print(f'Results saved to {timestamp_folder}.zip!')
-    pass
+    columns = ["pmid", 'abstract', "label", *INTERACTION_INDICATORS, 'unweighted_total', 'tagged_drugs', 'concepts', 'gene']
+    _write_results([_results_frame(results, columns, INTERACTION_INDICATORS)], f'{timestamp_folder}.parquet'.replace("/", "-"))
 
 
 
 def generate_indicators(abstracts, reference_df, start=0, stop=-1, mode='clinical'):
     gene = reference_df['Gene'][0]
+    lexicons = INTERACTION_INDICATORS if mode == 'interaction' else CLINICAL_INDICATORS
 
     timestamp = datetime.now().strftime("%Y-%m-%d")
     timestamp_folder = f'{timestamp}_{gene}'
 
-    for idx, row in tqdm(reference_df.iterrows()):
-        gene = str(row.get('Gene'))
-        drug = str(row.get('Drug'))
+    # Slice and unpack the abstracts once instead of re-boxing every row for every drug
+    records = _abstract_records(abstracts, start, stop)
+    # Lowercase each abstract once; every presence check and lexicon scan below reads these
+    texts = [abstract.lower() for _, abstract, _, _ in records]
+
+    # Indicator counts depend only on the abstract text, not on the drug, so each distinct
+    # text is scored once and reused; gene presence is likewise computed once per gene
+    score_text = _score_interaction if mode == 'interaction' else _score_clinical
+    scored = {}
+    gene_present = {}
+
+    # One consolidated file per gene; each row records the (gene, drug) pair it was evaluated for.
+    # Rows are packed into a typed frame per drug so the row dicts never outlive their drug
+    columns = ["pmid", "label", *lexicons, 'unweighted_total', 'tagged_drugs', 'concepts', 'gene', 'drug']
+    frames = []
+    for gene, drug in tqdm(reference_df[['Gene', 'Drug']].itertuples(index=False, name=None), total=len(reference_df)):
+        gene = str(gene)
+        drug = str(drug)
         drug = parse_drug_terms(drug)
-
+        drug_lower = drug[0].lower()
         results = []
-        for _, row in tqdm(abstracts.iloc[start:stop].iterrows(), desc="Abstracts", leave=False):
-            pmid = row['pmid'] if 'pmid' in row else row.iloc[0]
-            abstract = row['abstract'] if 'abstract' in row else row.iloc[1]
-            
-            # Handle Extra Columns for NLP Processing
-            try:
-                tagged_drugs = row['DRUG_LABELS']
-                concept = row['DRUG_IDS']
-            except:
-                tagged_drugs = None
-                concept = None
-            if mode == 'interaction':
-                label,scores = analyze_relation_interaction(drug[0], gene, abstract)
-            else:
-                label, scores = analyze_relation(drug[0], gene, abstract)
-            if label:
-                results.append({"pmid": pmid, "label": label, "scores": scores, 'tagged_drugs': tagged_drugs, 'concepts': concept  })
+        gene_lower = gene.lower()
+        if gene_lower not in gene_present:
+            gene_present[gene_lower] = [gene_lower in text for text in texts]
+
+        for (pmid, _, tagged_drugs, concept), text, has_gene in tqdm(zip(records, texts, gene_present[gene_lower]), total=len(records), desc="Abstracts", leave=False):
+            if not (has_gene and drug_lower in text):
+                label, scores = ('not_evaluated', 0.0)
             else:
-                results.append({"pmid": pmid, "label": label, "scores": scores })
-    
-            if results: 
-                os.makedirs(timestamp_folder, exist_ok=True)
-                out_filename = f'{gene}_{drug[0]}.csv'.replace("/", "-")
-                out_path = os.path.join(timestamp_folder, out_filename)
-                with open(out_path, "w", newline="") as fh:
-                    if label:
-                        writer = csv.DictWriter(fh, fieldnames=["pmid", "label", "scores", 'tagged_drugs', 'concepts'])
-                    else:
-                        writer = csv.DictWriter(fh, fieldnames=["pmid", "label", "scores"])
-                    writer.writeheader()
-                    writer.writerows(results)
-                    
-    archive_path = shutil.make_archive(base_name=timestamp_folder, format="zip", base_dir=f'{timestamp}_{gene}')
-    shutil.rmtree(timestamp_folder)
-    print(f'Results saved to {timestamp_folder}.zip!')
+                if text not in scored:
+                    scored[text] = score_text(text)
+                label, scores = scored[text]
+            results.append({"pmid": pmid, "label": label, **_score_columns(scores, lexicons), 'tagged_drugs': tagged_drugs, 'concepts': concept, 'gene': gene, 'drug': drug[0]})
+        frames.append(_results_frame(results, columns, lexicons))
 
+    _write_results(frames or [_results_frame([], columns, lexicons)], f'{timestamp_folder}.parquet'.replace("/", "-"))
@@ -1,64 +1,124 @@
 import argparse
 import ast
 import csv
+import io
 import os
+import re
+import threading
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from typing import List, Tuple
-import gc
 
 import time
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ChunkedEncodingError, RequestException
 
 import pandas as pd
 import requests
 from tqdm import tqdm
 
-def fetch_abstracts(pmids):
+def _parse_abstracts(content: bytes) -> List[Tuple[str, str]]:
+    """Stream ``(pmid, abstract)`` pairs out of an efetch XML payload, freeing each article once read."""
+    abstracts: List[Tuple[str, str]] = []
+    for _, elem in ET.iterparse(io.BytesIO(content), events=("end",)):
+        if elem.tag != "PubmedArticle":
+            continue
+        pmid_el = elem.find(".//PMID")
+        pmid = pmid_el.text if pmid_el is not None else ""
+        abstract = " ".join(
+            t.text or "" for t in elem.findall(".//AbstractText")
+        )
+        if abstract:
+            abstracts.append((pmid, abstract))
+        elem.clear()
+    return abstracts
+
+
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+
+# NCBI E-utilities allow 3 requests/second per client, 10 with an API key
+NCBI_REQUESTS_PER_SECOND = 3
+NCBI_REQUESTS_PER_SECOND_WITH_KEY = 10
+
+
+class _RateLimiter:
+    """Hands out evenly spaced request slots across threads, at most ``rate`` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(slot - now)
+
+
+def _fetch_batch(session, limiter, params, label, max_retries=5):
+    """GET one efetch batch with exponential-backoff retries; ``None`` if every attempt fails."""
+    for attempt in range(1, max_retries + 1):
+        limiter.wait()
+        try:
+            resp = session.get(EFETCH_URL, params=params, timeout=20)
+            resp.raise_for_status()
+            return resp
+        except (ChunkedEncodingError, RequestException) as e:
+            if attempt == max_retries:
+                print(f"[ERROR] Failed after {max_retries} attempts for batch {label}: {e}")
+                return None  # Skip this batch
+            wait = 2 ** attempt
+            print(f"[WARNING] Attempt {attempt} failed: {e}. Retrying in {wait}s...")
+            time.sleep(wait)
+
+
+def fetch_abstracts(pmids, api_key=None, max_workers=3):
     abstracts: List[Tuple[str, str]] = []
     if not pmids:
         return abstracts
 
-    fetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
     batch_size = 200
-    max_retries = 5
     print(f'{len(pmids)} PMIDs found!\nFetching...')
 
-    for i in tqdm(range(0, len(pmids), batch_size)):
-        batch = pmids[i : i + batch_size]
-        params = {
-            "db": "pubmed",
-            "id": ",".join(batch),
-            "retmode": "xml",
-        }
+    rate = NCBI_REQUESTS_PER_SECOND_WITH_KEY if api_key else NCBI_REQUESTS_PER_SECOND
+    limiter = _RateLimiter(rate)
+
+    # One keep-alive session shared by the workers so batches reuse pooled connections
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers))
+
+    batch_results = {}
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for i in range(0, len(pmids), batch_size):
+            batch = pmids[i : i + batch_size]
+            params = {
+                "db": "pubmed",
+                "id": ",".join(batch),
+                "retmode": "xml",
+            }
+            if api_key:
+                params["api_key"] = api_key
+            futures[executor.submit(_fetch_batch, session, limiter, params, f"{i}-{i+batch_size}")] = i
+
+        # Parse each response as it arrives while the remaining batches are still in flight
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            resp = future.result()
+            if resp is None:
+                continue  # skip to next batch on failure
 
-        for attempt in range(1, max_retries + 1):
             try:
-                resp = requests.get(fetch_url, params=params, timeout=20)
-                resp.raise_for_status()
-                break  # success, exit retry loop
-            except (ChunkedEncodingError, RequestException) as e:
-                if attempt == max_retries:
-                    print(f"[ERROR] Failed after {max_retries} attempts for batch {i}-{i+batch_size}: {e}")
-                    continue  # Skip this batch
-                wait = 2 ** attempt
-                print(f"[WARNING] Attempt {attempt} failed: {e}. Retrying in {wait}s...")
-                time.sleep(wait)
-        else:
-            continue  # skip to next batch on failure
+                batch_results[futures[future]] = _parse_abstracts(resp.content)
+            except ET.ParseError as e:
+                print(f"[ERROR] XML parse error: {e}")
+                continue
 
-        try:
-            root = ET.fromstring(resp.text)
-            for article in root.findall(".//PubmedArticle"):
-                pmid_el = article.find(".//PMID")
-                pmid = pmid_el.text if pmid_el is not None else ""
-                abstract = " ".join(
-                    t.text or "" for t in article.findall(".//AbstractText")
-                )
-                if abstract:
-                    abstracts.append((pmid, abstract))
-        except ET.ParseError as e:
-            print(f"[ERROR] XML parse error: {e}")
-            continue
+    # Keep the original PMID batch order regardless of completion order
+    for i in sorted(batch_results):
+        abstracts.extend(batch_results[i])
 
     return abstracts
 
@@ -104,59 +164,88 @@ def fetch_pmids_by_ncbi_gene_id(term: str) -> str:
     print(pmids)
     return pmids
 
+# PUBTATOR REFERENCE SETS
+PUBTATOR_DIR = os.path.join('data', 'pubtator')
+
+def _load_pubtator(name: str, columns: List[str]) -> pd.DataFrame:
+    """Load a Pubtator3 TSV, keeping a zstd Parquet copy next to it so later loads skip the TSV parse.
+
+    The copy is only trusted while it is at least as new as the TSV; a refreshed TSV rebuilds it.
+    """
+    tsv_path = os.path.join(PUBTATOR_DIR, name)
+    parquet_path = f'{tsv_path}.parquet'
+    if os.path.exists(parquet_path) and (not os.path.exists(tsv_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(tsv_path)):
+        return pd.read_parquet(parquet_path)
+
+    # ID and mention columns mix numeric-looking and text values, so pin them to str for Parquet
+    reference = pd.read_csv(tsv_path, sep='\t', header=None, names=columns, dtype={columns[2]: str, 'MentionText': str})
+    # Write beside the target and swap it in, so an interrupted write never leaves a truncated copy;
+    # the cache is best-effort, so a read-only or full disk just means the TSV is parsed next time too
+    tmp_path = f'{parquet_path}.tmp'
+    try:
+        reference.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, parquet_path)
+    except OSError as e:
+        print(f'Could not cache {tsv_path} as Parquet: {e}')
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return reference
+
+# Cached for the session: callers filter these frames but must never modify them in place
+@lru_cache(maxsize=1)
+def _load_gene_reference() -> pd.DataFrame:
+    return _load_pubtator('gene2pubtator3', ['PMID', 'EntityType', 'GeneID', 'MentionText', 'Source'])
+
+@lru_cache(maxsize=1)
+def _load_chemical_reference() -> pd.DataFrame:
+    chemical_reference = _load_pubtator('chemical2pubtator3', ['PMID', 'EntityType', 'ChemicalID', 'MentionText', 'Source'])
+    chemical_reference['MentionText'] = chemical_reference['MentionText'].str.lower()
+    return chemical_reference
+
+
 # PUBTATOR METHOD (GENE)
 def fetch_pmids_by_pubtator3(term: str) -> str:
     # Load Gene Pubtator3 Reference Set
-    gene_reference = pd.read_csv('data/pubtator/gene2pubtator3', sep='\t', header=None)
-    gene_reference.columns = ['PMID', 'EntityType', 'GeneID', 'MentionText', 'Source']
+    gene_reference = _load_gene_reference()
     print('Gene Pubtator3 set loaded!')
 
     # Grab PMIDs from Pubtator3 using Reference Set
-    gene_hits = gene_reference[gene_reference['MentionText'].str.contains(term, na=False)].reset_index(drop=True)
+    gene_hits = gene_reference[gene_reference['MentionText'].str.contains(term, na=False, regex=False)].reset_index(drop=True)
 
     pmids = list(gene_hits['PMID'])
     pmids = [str(pmid) for pmid in pmids]
 
-    # Clean up large variables
-    del gene_reference
-    gc.collect()
-
     return pmids
 
 
 # PUBTATOR METHOD (GENE+DRUG)
 def fetch_pmids_by_pubtator3drug(gene: str, drugs: List[str]) -> str:
     # Load Gene Pubtator3 Reference Set
-    gene_reference = pd.read_csv('data/pubtator/gene2pubtator3', sep='\t', header=None)
-    gene_reference.columns = ['PMID', 'EntityType', 'GeneID', 'MentionText', 'Source']
+    gene_reference = _load_gene_reference()
     print('Gene Pubtator3 set loaded!')
 
-    # Load Chemical Pubtator3 Reference Set
-    chemical_reference = pd.read_csv('data/pubtator/chemical2pubtator3', sep='\t', header=None)
-    chemical_reference.columns = ['PMID', 'EntityType', 'ChemicalID', 'MentionText', 'Source']
-    chemical_reference['MentionText'] = chemical_reference['MentionText'].apply(
-    lambda x: x.lower() if isinstance(x, str) else ''
-)
+    # Load Chemical Pubtator3 Reference Set (mentions lowercased)
+    chemical_reference = _load_chemical_reference()
     print('Drug Pubtator3 set loaded!')
 
     # Grab PMIDs from Pubtator3 using Reference Set
-    gene_hits = gene_reference[gene_reference['MentionText'].str.contains(gene, na=False)].reset_index(drop=True)
-
-    pmid_dict = {}
-    for drug in tqdm(drugs):
-        drug_hits = chemical_reference[chemical_reference['MentionText'].str.contains(drug.lower(), na=False)].reset_index(drop=True)
+    gene_hits = gene_reference[gene_reference['MentionText'].str.contains(gene, na=False, regex=False)].reset_index(drop=True)
 
-        merged_hits = pd.merge(gene_hits, drug_hits, on='PMID', how='inner')
-        merged_hits = merged_hits.sort_values(by='PMID', ascending=False)
-        merged_hits = merged_hits.drop_duplicates(subset='PMID', keep='first').reset_index(drop=True)
+    # One alternation pass over the full chemical set keeps only mentions of any drug in PMIDs
+    # that also mention the gene; the per-drug matching below then scans that small subset
+    drug_terms = [drug.lower() for drug in drugs]
+    drug_pattern = '|'.join(re.escape(term) for term in drug_terms)
+    candidates = chemical_reference[chemical_reference['MentionText'].str.contains(drug_pattern, na=False)]
+    candidates = candidates[candidates['PMID'].isin(gene_hits['PMID'].unique())]
 
-        pmids = list(merged_hits['PMID'])
-        pmids = [str(pmid) for pmid in pmids]   
+    pmid_dict = {}
+    for drug, term in tqdm(zip(drugs, drug_terms), total=len(drugs)):
+        drug_hits = candidates[candidates['MentionText'].str.contains(term, na=False, regex=False)]
+        pmids = drug_hits['PMID'].drop_duplicates().sort_values(ascending=False)
+        pmids = [str(pmid) for pmid in pmids]
 
         pmid_dict[drug] = pmids
 
-    # Clean up large variables
-    del gene_reference, chemical_reference
-    gc.collect() 
-
     return pmid_dict
\ No newline at end of file
@@ -5,12 +5,19 @@ import pandas as pd
 import requests
 from tqdm import tqdm
 import inflect  
+import shelve
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-PIPE_GENE = pipeline("token-classification", model="alvaroalon2/biobert_genetic_ner", aggregation_strategy="first")
+# Run the taggers on the first GPU when one is available
+DEVICE = 0 if torch.cuda.is_available() else -1
 
-PIPE_CHEMICAL = pipeline("token-classification", model="alvaroalon2/biobert_chemical_ner", aggregation_strategy="first")
+PIPE_GENE = pipeline("token-classification", model="alvaroalon2/biobert_genetic_ner", aggregation_strategy="first", device=DEVICE)
 
-PIPE_DISEASE = pipeline("token-classification", model="alvaroalon2/biobert_diseases_ner", aggregation_strategy="first")
+PIPE_CHEMICAL = pipeline("token-classification", model="alvaroalon2/biobert_chemical_ner", aggregation_strategy="first", device=DEVICE)
+
+PIPE_DISEASE = pipeline("token-classification", model="alvaroalon2/biobert_diseases_ner", aggregation_strategy="first", device=DEVICE)
 
 
 def process_text(text):    
@@ -22,13 +29,19 @@ def process_text(text):
     df = normalize(df)
     return df
 
-def batch(corpus):
-    df = pd.DataFrame()
-    for entry in tqdm(corpus):
-        tdf1 = _tag_genes(entry)
-        tdf2 = _tag_chemicals(entry)
-        tdf3 = _tag_diseases(entry)
-        df = pd.concat([df,tdf1,tdf2,tdf3])
+def batch(corpus, batch_size=32):
+    texts = list(corpus)
+    # Stream the corpus through each tagger so BioBERT runs batch_size texts per forward pass
+    gene_results = PIPE_GENE((text for text in texts), batch_size=batch_size)
+    chem_results = PIPE_CHEMICAL((text for text in texts), batch_size=batch_size)
+    disease_results = PIPE_DISEASE((text for text in texts), batch_size=batch_size)
+
+    frames = []
+    for entry, genes, chemicals, diseases in tqdm(zip(texts, gene_results, chem_results, disease_results), total=len(texts)):
+        frames.append(_entity_frame(genes, entry))
+        frames.append(_entity_frame(chemicals, entry))
+        frames.append(_entity_frame(diseases, entry))
+    df = pd.concat(frames, ignore_index=True)
     df = _drop_unknowns(df)
     df['start'] = df['start'].astype(int)
     df['end'] = df['end'].astype(int)
@@ -36,28 +49,63 @@ def batch(corpus):
     return df
 
 def normalize(result):
-    result['concept_match_type'] = None
-    result['concept_id'] = None
-    result['concept_label'] = None
-    for index, row in tqdm(result.iterrows()):
-        word = _singularize(row['word'])
-        if row['entity_group'] == 'GENETIC':
-            norm_result = _normalize_gene(word)
-        if row['entity_group'] == 'CHEMICAL':
-            norm_result = _normalize_therapy(word)
-        if row['entity_group'] == 'DISEASE':
-            norm_result = _normalize_disease(word)
-        result.at[index, 'concept_match_type'] = norm_result[0]
-        result.at[index, 'concept_id'] = norm_result[1]
-        result.at[index, 'concept_label'] = norm_result[2]
+    keys = [(group, _singularize(word)) for word, group in zip(result['word'].tolist(), result['entity_group'].tolist())]
+    normalized = _normalize_unique(keys)
+
+    match_types, concept_ids, concept_labels = [], [], []
+    for key in keys:
+        norm_result = normalized[key]
+        match_types.append(norm_result[0])
+        concept_ids.append(norm_result[1])
+        concept_labels.append(norm_result[2])
+    result['concept_match_type'] = pd.Series(match_types, index=result.index, dtype=object)
+    result['concept_id'] = pd.Series(concept_ids, index=result.index, dtype=object)
+    result['concept_label'] = pd.Series(concept_labels, index=result.index, dtype=object)
     return result
 
 
+INFLECTOR = inflect.engine()
+
+# Entity words repeat heavily across a corpus ("mice", "tumors", ...)
+@lru_cache(maxsize=8192)
 def _singularize(word):
-    inflector = inflect.engine()
-    return inflector.singular_noun(word) or word
+    return INFLECTOR.singular_noun(word) or word
+
+# On-disk (entity_group, word) -> normalizer result cache, persisted across sessions
+NORMALIZER_CACHE = 'normcache'
+NORMALIZER_WORKERS = 16
+
+def _normalize_entity(key):
+    entity_group, word = key
+    if entity_group == 'GENETIC':
+        return _normalize_gene(word)
+    if entity_group == 'CHEMICAL':
+        return _normalize_therapy(word)
+    if entity_group == 'DISEASE':
+        return _normalize_disease(word)
+    return [None, None, None]
+
+def _normalize_unique(keys):
+    """Normalize each distinct (entity_group, word) once, serving repeats from NORMALIZER_CACHE."""
+    normalized = {}
+    with shelve.open(NORMALIZER_CACHE) as cache:
+        misses = []
+        for key in set(keys):
+            cache_key = '|'.join(key)
+            if cache_key in cache:
+                normalized[key] = cache[cache_key]
+            else:
+                misses.append(key)
+
+        # The normalizer service is stateless, so overlap the remaining round-trips
+        with ThreadPoolExecutor(max_workers=NORMALIZER_WORKERS) as executor:
+            for key, norm_result in tqdm(zip(misses, executor.map(_normalize_entity, misses)), total=len(misses)):
+                normalized[key] = norm_result
+                # Failures may be transient, so only successful lookups are persisted
+                if norm_result[0] != 'Failure to Normalize':
+                    cache['|'.join(key)] = norm_result
+    return normalized
 
-# TODO: Implement cached queries to improve normalization time -- Brian Walsh/ Kori / James
 def _normalize_gene(word):
     r = requests.get(f'https://normalize.cancervariants.org/gene/normalize?q={word}')
     response = r.json()
@@ -123,20 +171,19 @@ def _drop_unknowns(result):
         dropped = result
     return dropped
 
-def _tag_genes(text):
-    gene_results = PIPE_GENE(text)
-    df = _drop_unknowns(pd.DataFrame(gene_results))
+def _entity_frame(entities, text):
+    df = _drop_unknowns(pd.DataFrame(entities))
     df['original_text'] = text
     return df
 
+def _tag_genes(text):
+    gene_results = PIPE_GENE(text)
+    return _entity_frame(gene_results, text)
+
 def _tag_chemicals(text):
     chem_results = PIPE_CHEMICAL(text)
-    df = _drop_unknowns(pd.DataFrame(chem_results))
-    df['original_text'] = text
-    return df
+    return _entity_frame(chem_results, text)
 
 def _tag_diseases(text):
     disease_results = PIPE_DISEASE(text)
-    df = _drop_unknowns(pd.DataFrame(disease_results))
-    df['original_text'] = text
-    return df
\ No newline at end of file
+    return _entity_frame(disease_results, text)
\ No newline at end of file
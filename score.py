@@ -3,7 +3,24 @@ import zipfile
 import pandas as pd
 import os, shutil
 
-def load_pmid_assessments(zip_file, search_method, out_dir="."):
+# Columns every per-drug CSV written by indicator.py starts with
+KNOWN_COLUMNS = ["pmid", "label", "scores"]
+
+def load_pmid_assessments(results_file, search_method, out_dir="."):
+    """
+    Loads the assessments written by indicator.py and tags them with <search_method>.
+    Parquet results already carry gene/drug and per-indicator columns and are read directly.
+    Legacy ZIP archives are extracted into <out_dir>/<zip_stem>/ and their CSVs concatenated.
+    """
+    if Path(results_file).suffix == ".parquet":
+        df = pd.read_parquet(results_file)
+        df["method"] = search_method
+        return df
+
+    return _load_zipped_assessments(results_file, search_method, out_dir)
+
+
+def _load_zipped_assessments(zip_file, search_method, out_dir="."):
     """
     Extracts <zip_file> into <out_dir>/<zip_stem>/ and concatenates all CSVs.
     Robust to empty files, mixed encodings, and various delimiters.
@@ -42,23 +59,34 @@ def load_pmid_assessments(zip_file, search_method, out_dir="."):
         last_err = None
         tdf = None
 
-        for enc in encodings_to_try:
-            try:
-                # sep=None + engine="python" asks pandas to infer delimiter
-                tdf = pd.read_csv(
-                    fpath,
-                    encoding=enc,
-                    sep=None,
-                    engine="python",
-                    on_bad_lines="skip",  # skip malformed rows instead of erroring
-                )
-                # If it loaded but has no columns (e.g., whitespace-only), treat as failure
-                if tdf.shape[1] == 0:
-                    raise pd.errors.EmptyDataError("No columns after parse")
-                break
-            except (UnicodeDecodeError, pd.errors.EmptyDataError, pd.errors.ParserError) as e:
-                last_err = e
+        # Fast path: our own output is utf-8 and comma-separated, so use the C parser directly
+        try:
+            tdf = pd.read_csv(fpath, encoding="utf-8", sep=",", engine="c")
+            if not set(KNOWN_COLUMNS).issubset(tdf.columns):
                 tdf = None
+        except (UnicodeDecodeError, pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+            last_err = e
+            tdf = None
+
+        # Slow path for anything else: sniff the delimiter and try other encodings
+        if tdf is None:
+            for enc in encodings_to_try:
+                try:
+                    # sep=None + engine="python" asks pandas to infer delimiter
+                    tdf = pd.read_csv(
+                        fpath,
+                        encoding=enc,
+                        sep=None,
+                        engine="python",
+                        on_bad_lines="skip",  # skip malformed rows instead of erroring
+                    )
+                    # If it loaded but has no columns (e.g., whitespace-only), treat as failure
+                    if tdf.shape[1] == 0:
+                        raise pd.errors.EmptyDataError("No columns after parse")
+                    break
+                except (UnicodeDecodeError, pd.errors.EmptyDataError, pd.errors.ParserError) as e:
+                    last_err = e
+                    tdf = None
 
         if tdf is None:
             failures.append((str(fpath), repr(last_err)))